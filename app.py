@@ -1,17 +1,43 @@
-from flask import Flask, render_template_string, request, redirect, url_for, session, flash
+from flask import Flask, render_template_string, request, redirect, url_for, session, flash, jsonify, g, abort
+from collections import OrderedDict
 from datetime import datetime
+import threading
+import unicodedata
+import bisect
+import heapq
 import secrets
+import atexit
+import json
+import time
 import os
+import re
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 
-# Database simulato (in memoria) - NOTA: su Render si resetterà ad ogni riavvio
-# Per persistenza reale servirebbero PostgreSQL o Redis
-players = {}
-pending_registrations = {}
-transactions = []
-settings = {'initial_balance': 100}
+# Stanze di gioco (banche indipendenti): ognuna ha i propri giocatori, transazioni,
+# impostazioni e amministratore. La partita "default" è servita alla radice del sito,
+# le altre vanno create da /rooms/new, con una propria password amministratore, e
+# sono servite sotto /g/<game_id>/...
+# Le stanze vengono caricate dal disco al primo accesso e scaricate quando inattive.
+# NOTA: su Render il disco è effimero, quindi i dati si perdono ad ogni nuovo deploy
+DEFAULT_GAME_ID = 'default'
+DEFAULT_ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+DATA_DIR = os.environ.get('DATA_DIR', 'data')
+MAX_GAMES_IN_MEMORY = int(os.environ.get('MAX_GAMES_IN_MEMORY', 200))
+GAME_IDLE_SECONDS = int(os.environ.get('GAME_IDLE_SECONDS', 1800))
+GAME_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,40}$')
+
+games = OrderedDict()  # game_id -> stato della stanza, in ordine di ultimo accesso
+dirty_games = set()
+# Richieste in corso per stanza: le stanze in uso non vengono scaricate, altrimenti
+# le modifiche finirebbero su un dizionario non più registrato e andrebbero perse
+game_refs = {}
+games_lock = threading.RLock()
+
+HISTORY_BUCKET_SECONDS = 60
+HISTORY_DEFAULT_POINTS = 60
+HISTORY_MAX_POINTS = 500
 
 # Template base
 BASE_TEMPLATE = '''
@@ -204,6 +230,32 @@ HOME_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
                 👤 Accedi come Giocatore
             </a>
         </div>
+        <p style="margin-top: 30px;">
+            <a href="{{ url_for('create_room') }}" style="color: #667eea;">🏠 Crea una nuova stanza di gioco</a>
+        </p>
+    </div>
+''')
+
+CREATE_ROOM_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+    <h1 style="text-align: center;">🏠 Nuova Stanza di Gioco</h1>
+    <div style="max-width: 400px; margin: 50px auto;">
+        <form method="POST">
+            <div class="form-group">
+                <label>Nome della stanza (lettere, numeri, - e _):</label>
+                <input type="text" name="game_id" pattern="[A-Za-z0-9_-]{1,40}" required autofocus>
+            </div>
+            <div class="form-group">
+                <label>Password Amministratore:</label>
+                <input type="password" name="admin_password" required minlength="4">
+            </div>
+            <button type="submit" class="btn btn-success" style="width: 100%;">Crea Stanza</button>
+        </form>
+        <p style="margin-top: 20px; text-align: center; color: #666;">
+            La stanza sarà raggiungibile all'indirizzo /g/&lt;nome&gt;/
+        </p>
+        <p style="margin-top: 10px; text-align: center;">
+            <a href="{{ url_for('index') }}" style="color: #667eea;">← Torna alla home</a>
+        </p>
     </div>
 ''')
 
@@ -220,9 +272,11 @@ ADMIN_LOGIN_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}'
         <p style="margin-top: 20px; text-align: center;">
             <a href="{{ url_for('index') }}" style="color: #667eea;">← Torna alla home</a>
         </p>
+        {% if default_password %}
         <p style="margin-top: 20px; text-align: center; color: #666; font-size: 12px;">
             Password predefinita: <strong>admin123</strong>
         </p>
+        {% endif %}
     </div>
 ''')
 
@@ -371,6 +425,8 @@ ADMIN_DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock
     
     <div class="menu">
         <a href="{{ url_for('transfer') }}" class="btn">💸 Nuovo Trasferimento</a>
+        <a href="{{ url_for('scheduled_transfers') }}" class="btn">⏰ Trasferimenti Programmati</a>
+        <a href="{{ url_for('search_transactions') }}" class="btn">🔍 Cerca Transazioni</a>
         <a href="{{ url_for('final_report') }}" class="btn">📊 Report Finale</a>
         <a href="{{ url_for('settings_page') }}" class="btn">⚙️ Impostazioni</a>
     </div>
@@ -542,6 +598,10 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
                 <label>Saldo Iniziale Predefinito:</label>
                 <input type="number" name="initial_balance" value="{{ settings.initial_balance }}" required>
             </div>
+            <div class="form-group">
+                <label>Nuova Password Amministratore:</label>
+                <input type="password" name="admin_password" placeholder="Lascia vuoto per non cambiarla" minlength="4">
+            </div>
             <button type="submit" class="btn btn-success" style="width: 100%;">Salva Impostazioni</button>
         </form>
         
@@ -557,27 +617,761 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
     </div>
 ''')
 
+SCHEDULED_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+    <div class="header">
+        <h1>⏰ Trasferimenti Programmati</h1>
+        <a href="{{ url_for('admin_dashboard') }}" class="btn">← Dashboard</a>
+    </div>
+    
+    <div style="max-width: 500px; margin: 0 auto 40px;">
+        <form method="POST">
+            <div class="form-group">
+                <label>Da Giocatore:</label>
+                <select name="from_player" required>
+                    <option value="">Seleziona...</option>
+                    {% for player_id, player in players.items() %}
+                        <option value="{{ player_id }}">{{ player.name }} (€{{ player.balance }})</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="form-group">
+                <label>A Giocatori:</label>
+                {% for player_id, player in players.items() %}
+                    <label style="font-weight: normal;">
+                        <input type="checkbox" name="to_players" value="{{ player_id }}" style="width: auto;"> {{ player.name }}
+                    </label>
+                {% endfor %}
+            </div>
+            <div class="form-group">
+                <label>Importo (per ogni destinatario):</label>
+                <input type="number" name="amount" min="1" required>
+            </div>
+            <div class="form-group">
+                <label>Motivo:</label>
+                <input type="text" name="reason" placeholder="es. Stipendio" required>
+            </div>
+            <div class="form-group">
+                <label>Prima esecuzione tra (minuti):</label>
+                <input type="number" name="delay" min="0" value="0" required>
+            </div>
+            <div class="form-group">
+                <label>Ripeti ogni (minuti, 0 = una volta sola):</label>
+                <input type="number" name="interval" min="0" value="0" required>
+            </div>
+            <button type="submit" class="btn btn-success" style="width: 100%;">Programma Trasferimento</button>
+        </form>
+    </div>
+
+    {% if jobs %}
+        <table>
+            <thead>
+                <tr>
+                    <th>Prossima Esecuzione</th>
+                    <th>Da</th>
+                    <th>A</th>
+                    <th>Importo</th>
+                    <th>Motivo</th>
+                    <th>Ripetizione</th>
+                    <th></th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for job in jobs %}
+                <tr>
+                    <td>
+                        {% if job.failed %}
+                            <span style="color: #e74c3c;">✗ Non eseguito</span>
+                        {% else %}
+                            {{ job.next_run|orario }}
+                        {% endif %}
+                    </td>
+                    <td>{{ players[job.from_player].name if job.from_player in players else job.from_player }}</td>
+                    <td>{% for p in job.to_players %}{{ players[p].name if p in players else p }}{{ ', ' if not loop.last }}{% endfor %}</td>
+                    <td style="font-weight: bold;">€{{ job.amount }}</td>
+                    <td>
+                        {{ job.reason }}
+                        {% if job.last_error %}<div style="color: #e74c3c; font-size: 12px;">{{ job.last_error }}</div>{% endif %}
+                    </td>
+                    <td>{{ 'Ogni %d min'|format(job.interval // 60) if job.interval else 'Una volta' }}</td>
+                    <td>
+                        <form method="POST" action="{{ url_for('cancel_scheduled_transfer', job_id=job.id) }}">
+                            <button type="submit" class="btn btn-danger">✗ Annulla</button>
+                        </form>
+                    </td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    {% else %}
+        <p style="text-align: center; color: #999; padding: 40px;">Nessun trasferimento programmato</p>
+    {% endif %}
+''')
+
+SEARCH_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+    <div class="header">
+        <h1>🔍 Cerca Transazioni</h1>
+        <a href="{{ url_for('admin_dashboard') }}" class="btn">← Dashboard</a>
+    </div>
+    
+    <form method="GET" style="display: grid; grid-template-columns: repeat(auto-fit, minmax(180px, 1fr)); gap: 15px; margin-bottom: 30px;">
+        <div class="form-group">
+            <label>Motivo contiene:</label>
+            <input type="text" name="q" value="{{ args.q or '' }}" placeholder="es. tombola">
+        </div>
+        <div class="form-group">
+            <label>Giocatore:</label>
+            <select name="player">
+                <option value="">Tutti</option>
+                {% for player_id, player in players.items() %}
+                    <option value="{{ player_id }}" {{ 'selected' if args.player == player_id else '' }}>{{ player.name }}</option>
+                {% endfor %}
+            </select>
+        </div>
+        <div class="form-group">
+            <label>Importo minimo:</label>
+            <input type="number" name="min_amount" value="{{ args.min_amount or '' }}">
+        </div>
+        <div class="form-group">
+            <label>Importo massimo:</label>
+            <input type="number" name="max_amount" value="{{ args.max_amount or '' }}">
+        </div>
+        <div class="form-group">
+            <label>Dal:</label>
+            <input type="datetime-local" name="date_from" value="{{ args.date_from or '' }}">
+        </div>
+        <div class="form-group">
+            <label>Al:</label>
+            <input type="datetime-local" name="date_to" value="{{ args.date_to or '' }}">
+        </div>
+        <button type="submit" class="btn" style="align-self: end; margin-bottom: 20px;">Cerca</button>
+    </form>
+
+    {% if results %}
+        <table>
+            <thead>
+                <tr>
+                    <th>Data/Ora</th>
+                    <th>Da</th>
+                    <th>A</th>
+                    <th>Importo</th>
+                    <th>Motivo</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for t in results %}
+                <tr>
+                    <td>{{ t.timestamp }}</td>
+                    <td>{{ t.from_player }}</td>
+                    <td>{{ t.to_player }}</td>
+                    <td style="color: #27ae60; font-weight: bold;">€{{ t.amount }}</td>
+                    <td>{{ t.reason }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        <div style="display: flex; justify-content: space-between; margin-top: 20px;">
+            {% if page > 1 %}
+                <a href="{{ url_for('search_transactions', **dict(args, page=page - 1)) }}" class="btn">← Precedenti</a>
+            {% else %}
+                <span></span>
+            {% endif %}
+            <span style="color: #666; align-self: center;">Pagina {{ page }}</span>
+            {% if has_next %}
+                <a href="{{ url_for('search_transactions', **dict(args, page=page + 1)) }}" class="btn">Successive →</a>
+            {% else %}
+                <span></span>
+            {% endif %}
+        </div>
+    {% else %}
+        <p style="text-align: center; color: #999; padding: 40px;">Nessuna transazione trovata</p>
+    {% endif %}
+''')
+
+# STANZE DI GIOCO
+def new_game(admin_password=DEFAULT_ADMIN_PASSWORD):
+    return {
+        'players': {},
+        'pending_registrations': {},
+        'transactions': [],
+        'settings': {'initial_balance': 100, 'admin_password': admin_password},
+        # Serie storica dei saldi: player_id -> lista di bucket [inizio_minuto, min, max, ultimo]
+        'balance_history': {},
+        # Trasferimenti programmati: job_id -> definizione (vedi schedule_transfer)
+        'scheduled_jobs': {},
+        'last_access': time.time()
+    }
+
+def game_path(game_id):
+    return os.path.join(DATA_DIR, f'{game_id}.json')
+
+def load_game(game_id):
+    """Carica la stanza dal disco; None se non esiste (la default esiste sempre)."""
+    game = new_game()
+    try:
+        with open(game_path(game_id), encoding='utf-8') as f:
+            game.update(json.load(f))
+    except FileNotFoundError:
+        if game_id != DEFAULT_GAME_ID:
+            return None
+    game['last_access'] = time.time()
+    return game
+
+def save_game(game_id, game):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    data = {k: v for k, v in game.items() if k not in ('last_access', 'search_index')}
+    tmp_path = game_path(game_id) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, game_path(game_id))
+
+def unload_game(game_id):
+    game = games.pop(game_id)
+    if game_id in dirty_games:
+        save_game(game_id, game)
+        dirty_games.discard(game_id)
+
+def evict_games(keep=None):
+    """Scarica le stanze inattive da troppo tempo e, oltre il limite, le meno usate."""
+    now = time.time()
+    for game_id in list(games):
+        over_limit = len(games) > MAX_GAMES_IN_MEMORY
+        idle = now - games[game_id]['last_access'] > GAME_IDLE_SECONDS
+        if not over_limit and not idle:
+            # Le stanze sono in ordine di accesso: le successive sono più recenti
+            break
+        if game_id != keep and game_id not in game_refs:
+            unload_game(game_id)
+
+def get_game(game_id):
+    with games_lock:
+        game = games.get(game_id)
+        if game is None:
+            game = load_game(game_id)
+            if game is None:
+                return None
+            game['search_index'] = build_search_index(game['transactions'])
+            games[game_id] = game
+        else:
+            games.move_to_end(game_id)
+            game['last_access'] = time.time()
+        evict_games(keep=game_id)
+        return game
+
+def create_game(game_id, admin_password):
+    """Crea e salva subito una nuova stanza; None se il nome è già in uso."""
+    with games_lock:
+        if game_id == DEFAULT_GAME_ID or game_id in games or os.path.exists(game_path(game_id)):
+            return None
+        game = new_game(admin_password)
+        save_game(game_id, game)
+        game['search_index'] = build_search_index(game['transactions'])
+        games[game_id] = game
+        evict_games(keep=game_id)
+        return game
+
+def pin_game(game_id):
+    """Come get_game, ma la stanza resta in memoria fino a unpin_game."""
+    with games_lock:
+        game = get_game(game_id)
+        if game is not None:
+            game_refs[game_id] = game_refs.get(game_id, 0) + 1
+        return game
+
+def unpin_game(game_id):
+    with games_lock:
+        game_refs[game_id] -= 1
+        if not game_refs[game_id]:
+            del game_refs[game_id]
+
+def mark_dirty(game_id):
+    with games_lock:
+        dirty_games.add(game_id)
+
+@atexit.register
+def save_all_games():
+    with games_lock:
+        for game_id in list(dirty_games):
+            if game_id in games:
+                save_game(game_id, games[game_id])
+        dirty_games.clear()
+
+game_endpoints = set()
+
+def game_route(rule, **options):
+    """Registra la stessa vista alla radice (partita default) e sotto /g/<game_id>."""
+    def decorator(f):
+        app.add_url_rule(rule, f.__name__, f, **options)
+        app.add_url_rule('/g/<game_id>' + rule, f.__name__, f, **options)
+        game_endpoints.add(f.__name__)
+        return f
+    return decorator
+
+@app.url_value_preprocessor
+def pull_game_id(endpoint, values):
+    if endpoint not in game_endpoints:
+        return
+    game_id = values.pop('game_id', DEFAULT_GAME_ID) if values else DEFAULT_GAME_ID
+    # Le stanze sconosciute non vengono create: si creano solo da /rooms/new
+    game = pin_game(game_id) if GAME_ID_PATTERN.match(game_id) else None
+    if game is None:
+        abort(404)
+    g.game_id = game_id
+    g.game = game
+    g.pinned_game_id = game_id
+
+@app.teardown_request
+def release_game(exc):
+    if 'pinned_game_id' in g:
+        unpin_game(g.pop('pinned_game_id'))
+
+@app.url_defaults
+def add_game_id(endpoint, values):
+    game_id = g.get('game_id', DEFAULT_GAME_ID)
+    if game_id != DEFAULT_GAME_ID and endpoint in game_endpoints:
+        values.setdefault('game_id', game_id)
+
+def session_key(name, game_id=None):
+    """Chiave di sessione separata per stanza, così ogni partita ha i propri login."""
+    game_id = game_id or g.get('game_id', DEFAULT_GAME_ID)
+    return name if game_id == DEFAULT_GAME_ID else f'{game_id}:{name}'
+
+# STORICO SALDI
+def record_balance(game, player_id, balance, now=None):
+    """Aggiorna il bucket del minuto corrente (min/max/ultimo) per il giocatore."""
+    now = int(now if now is not None else time.time())
+    start = now - now % HISTORY_BUCKET_SECONDS
+    buckets = game['balance_history'].setdefault(player_id, [])
+    if buckets and buckets[-1][0] == start:
+        bucket = buckets[-1]
+        bucket[1] = min(bucket[1], balance)
+        bucket[2] = max(bucket[2], balance)
+        bucket[3] = balance
+    else:
+        buckets.append([start, balance, balance, balance])
+
+def downsample_minmax(buckets, points):
+    """Raggruppa i bucket in al massimo `points` gruppi conservando min, max e ultimo."""
+    if len(buckets) <= points:
+        return [list(b) for b in buckets]
+    size = -(-len(buckets) // points)
+    result = []
+    for i in range(0, len(buckets), size):
+        group = buckets[i:i + size]
+        result.append([group[0][0],
+                       min(b[1] for b in group),
+                       max(b[2] for b in group),
+                       group[-1][3]])
+    return result
+
+def downsample_lttb(buckets, points):
+    """Largest-Triangle-Three-Buckets sui valori finali: restituisce coppie [t, saldo]."""
+    data = [(b[0], b[3]) for b in buckets]
+    if points >= len(data):
+        return [list(p) for p in data]
+    if points < 3:
+        return [list(data[0]), list(data[-1])]
+    sampled = [data[0]]
+    every = (len(data) - 2) / (points - 2)
+    a = 0
+    for i in range(points - 2):
+        # Media del bucket successivo, usata come terzo vertice del triangolo
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(data))
+        next_range = data[next_start:next_end]
+        avg_t = sum(p[0] for p in next_range) / len(next_range)
+        avg_v = sum(p[1] for p in next_range) / len(next_range)
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        at, av = data[a]
+        best_area = -1
+        best = start
+        for j in range(start, end):
+            t, v = data[j]
+            area = abs((at - avg_t) * (v - av) - (at - t) * (avg_v - av))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(data[best])
+        a = best
+    sampled.append(data[-1])
+    return [list(p) for p in sampled]
+
+# RICERCA TRANSAZIONI
+SEARCH_PAGE_SIZE = 50
+# Parametri accettati dal form di ricerca (gli altri non finiscono nei link di paginazione)
+SEARCH_FILTERS = ('q', 'player', 'min_amount', 'max_amount', 'date_from', 'date_to')
+
+def tokenize(text):
+    """Parole in minuscolo e senza accenti, così "Città" trova anche "citta"."""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r'\w+', text)
+
+def new_search_index():
+    # Liste di posizioni nella lista transactions, sempre ordinate perché le
+    # transazioni vengono solo aggiunte in coda; 'amount_values' sono gli importi
+    # distinti in ordine crescente, per trovare le liste di un intervallo di importi
+    return {'tokens': {}, 'players': {}, 'amounts': {}, 'amount_values': [], 'ts': []}
+
+def transaction_ts(t):
+    if 'ts' in t:
+        return t['ts']
+    return int(datetime.strptime(t['timestamp'], '%d/%m/%Y %H:%M:%S').timestamp())
+
+def index_transaction(index, i, t):
+    for token in set(tokenize(t['reason'])):
+        index['tokens'].setdefault(token, []).append(i)
+    index['players'].setdefault(t['from_player'], []).append(i)
+    if t['to_player'] != t['from_player']:
+        index['players'].setdefault(t['to_player'], []).append(i)
+    if t['amount'] not in index['amounts']:
+        bisect.insort(index['amount_values'], t['amount'])
+    index['amounts'].setdefault(t['amount'], []).append(i)
+    index['ts'].append(transaction_ts(t))
+
+def build_search_index(transactions):
+    index = new_search_index()
+    # I motivi si ripetono molto ("Stipendio", ...): si raggruppano le posizioni
+    # per motivo e ogni motivo distinto viene tokenizzato una volta sola
+    by_reason = {}
+    players = index['players']
+    amounts = index['amounts']
+    for i, t in enumerate(transactions):
+        by_reason.setdefault(t['reason'], []).append(i)
+        players.setdefault(t['from_player'], []).append(i)
+        if t['to_player'] != t['from_player']:
+            players.setdefault(t['to_player'], []).append(i)
+        amounts.setdefault(t['amount'], []).append(i)
+    index['amount_values'] = sorted(amounts)
+    
+    tokens = index['tokens']
+    for reason, positions in by_reason.items():
+        for token in set(tokenize(reason)):
+            tokens.setdefault(token, []).extend(positions)
+    for postings in tokens.values():
+        # Concatenazione di sequenze già ordinate: il sort di Python è lineare qui
+        postings.sort()
+    
+    index['ts'] = [transaction_ts(t) for t in transactions]
+    return index
+
+def contains(postings, i):
+    pos = bisect.bisect_left(postings, i)
+    return pos < len(postings) and postings[pos] == i
+
+def query_transactions(game, query='', player_name=None, min_amount=None, max_amount=None,
+                 ts_from=None, ts_to=None, page=1, page_size=SEARCH_PAGE_SIZE):
+    """Restituisce (transazioni della pagina, dalla più recente; c'è una pagina successiva?).
+    
+    Ogni filtro diventa una lista ordinata di posizioni ristretta all'intervallo
+    temporale: le parole, il giocatore e l'unione delle liste degli importi.
+    Si parte dalla più corta e la si interseca con le altre, usando gli insiemi
+    (in C) o, se l'altra lista è molto più lunga, la ricerca binaria. Se il
+    filtro sugli importi non è il più selettivo viene verificato solo sulle
+    transazioni che servono a riempire la pagina.
+    """
+    transactions = game['transactions']
+    index = game['search_index']
+    
+    lists = [index['tokens'].get(token, []) for token in tokenize(query)]
+    if player_name is not None:
+        lists.append(index['players'].get(player_name, []))
+    
+    # Intervallo di posizioni compatibile con il filtro temporale
+    lo = bisect.bisect_left(index['ts'], ts_from) if ts_from is not None else 0
+    hi = bisect.bisect_right(index['ts'], ts_to) if ts_to is not None else len(transactions)
+    candidates = [p[bisect.bisect_left(p, lo):bisect.bisect_left(p, hi)] for p in lists]
+    
+    check_amount = min_amount is not None or max_amount is not None
+    if check_amount:
+        values = index['amount_values']
+        first = bisect.bisect_left(values, min_amount) if min_amount is not None else 0
+        last = bisect.bisect_right(values, max_amount) if max_amount is not None else len(values)
+        bounds = []
+        for amount in values[first:last]:
+            p = index['amounts'][amount]
+            bounds.append((p, bisect.bisect_left(p, lo), bisect.bisect_left(p, hi)))
+        amount_size = sum(end - start for _, start, end in bounds)
+        # L'unione degli importi diventa una lista solo se è la più corta e se
+        # costruirla (circa amount_size) costa meno che verificare l'importo
+        # scorrendo (circa risultati richiesti / frazione che passa il filtro)
+        needed = page * page_size + 1
+        shortest = not candidates or amount_size <= min(len(c) for c in candidates)
+        if shortest and (candidates or amount_size * amount_size < needed * (hi - lo)):
+            merged = []
+            for p, start, end in bounds:
+                merged.extend(p[start:end])
+            # Concatenazione di sequenze già ordinate: il sort di Python è lineare qui
+            merged.sort()
+            candidates.append(merged)
+            check_amount = False
+    
+    if not candidates:
+        candidates.append(range(lo, max(lo, hi)))
+    candidates.sort(key=len)
+    positions = candidates[0]
+    common = None
+    for other in candidates[1:]:
+        size = len(positions) if common is None else len(common)
+        if not size:
+            break
+        if len(other) > 16 * size:
+            # Lista molto più lunga: meglio cercarvi ogni posizione con la bisezione
+            if common is not None:
+                positions, common = sorted(common), None
+            n = len(other)
+            positions = [i for i in positions
+                         if (k := bisect.bisect_left(other, i)) < n and other[k] == i]
+        else:
+            if common is None:
+                common = set(positions)
+            common.intersection_update(other)
+    if common is not None:
+        positions = sorted(common)
+    
+    skip = (page - 1) * page_size
+    if not check_amount:
+        top = len(positions) - skip
+        results = [transactions[positions[k]] for k in range(top - 1, max(top - page_size, 0) - 1, -1)]
+        return results, top - page_size > 0
+    
+    results = []
+    for k in range(len(positions) - 1, -1, -1):
+        amount = transactions[positions[k]]['amount']
+        if (min_amount is not None and amount < min_amount) or (max_amount is not None and amount > max_amount):
+            continue
+        if skip:
+            skip -= 1
+            continue
+        if len(results) == page_size:
+            return results, True
+        results.append(transactions[positions[k]])
+    return results, False
+
+def parse_datetime_local(value):
+    """Valore di un <input type="datetime-local"> in secondi epoch; None se non valido."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M').timestamp()
+    except ValueError:
+        return None
+
+# TRASFERIMENTI
+def apply_transfer(game, from_player, to_player, amount, reason):
+    """Valida ed esegue un trasferimento; restituisce un messaggio di errore oppure None."""
+    players = game['players']
+    with games_lock:
+        if from_player not in players or to_player not in players:
+            return 'Giocatore non trovato!'
+        
+        if amount is None or amount <= 0:
+            return 'Importo non valido!'
+        
+        if from_player == to_player:
+            return 'Non puoi trasferire denaro allo stesso giocatore!'
+        
+        if players[from_player]['balance'] < amount:
+            return 'Saldo insufficiente!'
+        
+        players[from_player]['balance'] -= amount
+        players[to_player]['balance'] += amount
+        record_balance(game, from_player, players[from_player]['balance'])
+        record_balance(game, to_player, players[to_player]['balance'])
+        
+        now = datetime.now()
+        transaction = {
+            'timestamp': now.strftime('%d/%m/%Y %H:%M:%S'),
+            'ts': int(now.timestamp()),
+            'from_player': players[from_player]['name'],
+            'to_player': players[to_player]['name'],
+            'amount': amount,
+            'reason': reason
+        }
+        game['transactions'].append(transaction)
+        index_transaction(game['search_index'], len(game['transactions']) - 1, transaction)
+    return None
+
+# TRASFERIMENTI PROGRAMMATI
+class TransferScheduler:
+    """Un solo thread in background con una coda a priorità (heap) di esecuzioni.
+    
+    Lo heap contiene solo (orario, seq, game_id, job_id): la definizione del job
+    vive nello stato della stanza. Annullare o riprogrammare un job non tocca lo
+    heap: le voci non più valide vengono scartate quando arrivano in cima.
+    """
+
+    def __init__(self, clock=time.time, batch_size=500):
+        self.clock = clock
+        self.batch_size = batch_size
+        self.heap = []
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def push(self, game_id, job_id, run_at):
+        with self.condition:
+            self.seq += 1
+            heapq.heappush(self.heap, (run_at, self.seq, game_id, job_id))
+            # Il thread va svegliato solo se il nuovo job anticipa la prossima scadenza
+            if self.heap[0][1] == self.seq:
+                self.condition.notify()
+
+    def pop_due(self, now):
+        due = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+                due.append(heapq.heappop(self.heap))
+        return due
+
+    def run_pending(self, now=None):
+        """Esegue un lotto di job scaduti, raggruppati per stanza; restituisce quanti."""
+        now = self.clock() if now is None else now
+        due = self.pop_due(now)
+        by_game = {}
+        for run_at, _, game_id, job_id in due:
+            by_game.setdefault(game_id, []).append((run_at, job_id))
+        
+        executed = 0
+        for game_id, entries in by_game.items():
+            with games_lock:
+                game = get_game(game_id)
+                if game is None:
+                    continue
+                for run_at, job_id in entries:
+                    job = game['scheduled_jobs'].get(job_id)
+                    if job is None or job['next_run'] != run_at or job.get('failed'):
+                        continue
+                    run_job(game, job, now)
+                    if job['last_error']:
+                        app.logger.warning('Trasferimento programmato %s della stanza %s non riuscito: %s',
+                                           job_id, game_id, job['last_error'])
+                    if job['interval']:
+                        self.push(game_id, job_id, job['next_run'])
+                    elif job['last_error']:
+                        # I job una tantum falliti restano visibili finché l'admin non li annulla
+                        job['failed'] = True
+                    else:
+                        del game['scheduled_jobs'][job_id]
+                    executed += 1
+                mark_dirty(game_id)
+        return executed
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while True:
+                    timeout = self.heap[0][0] - self.clock() if self.heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+            try:
+                self.run_pending()
+            except Exception:
+                app.logger.exception('Errore durante i trasferimenti programmati')
+
+    def start(self):
+        """Riprende i job salvati e avvia il thread; le chiamate successive non fanno nulla."""
+        if self.thread is None:
+            self.resume_from_disk()
+            self.thread = threading.Thread(target=self.loop, name='transfer-scheduler', daemon=True)
+            self.thread.start()
+
+    def resume_from_disk(self):
+        """Riprogramma i job delle stanze salvate, senza tenerle in memoria."""
+        if not os.path.isdir(DATA_DIR):
+            return
+        for filename in os.listdir(DATA_DIR):
+            if not filename.endswith('.json'):
+                continue
+            game_id = filename[:-len('.json')]
+            with games_lock:
+                jobs = games[game_id]['scheduled_jobs'] if game_id in games else load_game(game_id)['scheduled_jobs']
+            for job_id, job in jobs.items():
+                if not job.get('failed'):
+                    self.push(game_id, job_id, job['next_run'])
+
+def run_job(game, job, now):
+    errors = []
+    for to_player in job['to_players']:
+        error = apply_transfer(game, job['from_player'], to_player, job['amount'], job['reason'])
+        if error:
+            errors.append(f"{game['players'].get(to_player, {}).get('name', to_player)}: {error}")
+    job['last_error'] = '; '.join(errors) or None
+    if job['interval']:
+        # Le esecuzioni perse (es. server fermo) vengono accorpate in una sola
+        while job['next_run'] <= now:
+            job['next_run'] += job['interval']
+
+def schedule_transfer(game_id, game, from_player, to_players, amount, reason, run_at, interval=None):
+    job_id = f"job_{secrets.token_hex(4)}"
+    game['scheduled_jobs'][job_id] = {
+        'id': job_id,
+        'from_player': from_player,
+        'to_players': to_players,
+        'amount': amount,
+        'reason': reason,
+        'next_run': run_at,
+        'interval': interval,
+        'last_error': None
+    }
+    scheduler.push(game_id, job_id, run_at)
+    return job_id
+
+scheduler = TransferScheduler()
+
+@app.template_filter('orario')
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime('%d/%m/%Y %H:%M:%S')
+
 # ROUTES
-@app.route('/')
+@app.route('/rooms/new', methods=['GET', 'POST'])
+def create_room():
+    if request.method == 'POST':
+        game_id = request.form.get('game_id', '')
+        admin_password = request.form.get('admin_password', '')
+        
+        if not GAME_ID_PATTERN.match(game_id):
+            flash('Nome della stanza non valido!', 'error')
+            return redirect(url_for('create_room'))
+        
+        if len(admin_password) < 4:
+            flash('La password deve avere almeno 4 caratteri!', 'error')
+            return redirect(url_for('create_room'))
+        
+        if create_game(game_id, admin_password) is None:
+            flash('Esiste già una stanza con questo nome!', 'error')
+            return redirect(url_for('create_room'))
+        
+        session[session_key('admin', game_id)] = True
+        flash(f'Stanza {game_id} creata!', 'success')
+        return redirect(url_for('admin_dashboard', game_id=game_id))
+    
+    return render_template_string(CREATE_ROOM_TEMPLATE)
+
+@game_route('/')
 def index():
-    if 'admin' in session:
+    if session_key('admin') in session:
         return redirect(url_for('admin_dashboard'))
-    if 'player_id' in session:
+    if session_key('player_id') in session:
         return redirect(url_for('player_dashboard'))
     return render_template_string(HOME_TEMPLATE)
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@game_route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
+    settings = g.game['settings']
     if request.method == 'POST':
         password = request.form.get('password')
-        if password == 'admin123':
-            session['admin'] = True
+        if password == settings['admin_password']:
+            session[session_key('admin')] = True
             return redirect(url_for('admin_dashboard'))
         flash('Password errata!', 'error')
-    return render_template_string(ADMIN_LOGIN_TEMPLATE)
+    return render_template_string(ADMIN_LOGIN_TEMPLATE,
+                                 default_password=g.game_id == DEFAULT_GAME_ID and settings['admin_password'] == 'admin123')
 
-@app.route('/player/register', methods=['GET', 'POST'])
+@game_route('/player/register', methods=['GET', 'POST'])
 def player_register():
+    players = g.game['players']
+    pending_registrations = g.game['pending_registrations']
     if request.method == 'POST':
         name = request.form.get('name')
         password = request.form.get('password')
@@ -592,49 +1386,53 @@ def player_register():
             'password': password,
             'timestamp': datetime.now().strftime('%d/%m/%Y %H:%M')
         }
+        mark_dirty(g.game_id)
         flash('Richiesta inviata! Attendi l\'approvazione dell\'amministratore.', 'success')
         return redirect(url_for('index'))
     
     return render_template_string(PLAYER_REGISTER_TEMPLATE)
 
-@app.route('/player/login', methods=['GET', 'POST'])
+@game_route('/player/login', methods=['GET', 'POST'])
 def player_login():
+    players = g.game['players']
     if request.method == 'POST':
         player_id = request.form.get('player_id')
         password = request.form.get('password')
         
         if player_id in players and players[player_id]['password'] == password:
-            session['player_id'] = player_id
+            session[session_key('player_id')] = player_id
             return redirect(url_for('player_dashboard'))
         flash('Credenziali errate!', 'error')
     
     return render_template_string(PLAYER_LOGIN_TEMPLATE, players=players)
 
-@app.route('/admin/dashboard')
+@game_route('/admin/dashboard')
 def admin_dashboard():
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
+    players = g.game['players']
     total_money = sum(p['balance'] for p in players.values())
     return render_template_string(ADMIN_DASHBOARD_TEMPLATE, 
                                  players=players,
-                                 pending_registrations=pending_registrations,
-                                 transactions=transactions,
+                                 pending_registrations=g.game['pending_registrations'],
+                                 transactions=g.game['transactions'],
                                  total_money=total_money)
 
-@app.route('/player/dashboard')
+@game_route('/player/dashboard')
 def player_dashboard():
-    if 'player_id' not in session:
+    if session_key('player_id') not in session:
         return redirect(url_for('player_login'))
     
-    player_id = session['player_id']
+    players = g.game['players']
+    player_id = session[session_key('player_id')]
     if player_id not in players:
-        session.pop('player_id', None)
+        session.pop(session_key('player_id'), None)
         flash('Account non trovato!', 'error')
         return redirect(url_for('index'))
     
     player = players[player_id]
-    player_transactions = [t for t in transactions if t['from_player'] == player['name'] or t['to_player'] == player['name']]
+    player_transactions = [t for t in g.game['transactions'] if t['from_player'] == player['name'] or t['to_player'] == player['name']]
     
     return render_template_string(PLAYER_DASHBOARD_TEMPLATE,
                                  player=player,
@@ -642,107 +1440,244 @@ def player_dashboard():
                                  player_transactions=player_transactions,
                                  all_players=players)
 
-@app.route('/admin/approve/<reg_id>', methods=['POST'])
+@game_route('/admin/approve/<reg_id>', methods=['POST'])
 def approve_player(reg_id):
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
+    players = g.game['players']
+    pending_registrations = g.game['pending_registrations']
+    initial_balance = g.game['settings']['initial_balance']
     if reg_id in pending_registrations:
         reg = pending_registrations.pop(reg_id)
         player_id = f"player_{len(players) + 1}"
         players[player_id] = {
             'name': reg['name'],
             'password': reg['password'],
-            'balance': settings['initial_balance']
+            'balance': initial_balance
         }
+        record_balance(g.game, player_id, initial_balance)
+        mark_dirty(g.game_id)
         flash(f'Giocatore {reg["name"]} approvato!', 'success')
     
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/admin/reject/<reg_id>', methods=['POST'])
+@game_route('/admin/reject/<reg_id>', methods=['POST'])
 def reject_player(reg_id):
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
+    pending_registrations = g.game['pending_registrations']
     if reg_id in pending_registrations:
         reg = pending_registrations.pop(reg_id)
+        mark_dirty(g.game_id)
         flash(f'Richiesta di {reg["name"]} rifiutata.', 'success')
     
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/admin/transfer', methods=['GET', 'POST'])
+@game_route('/admin/transfer', methods=['GET', 'POST'])
 def transfer():
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
+    players = g.game['players']
     if request.method == 'POST':
         from_player = request.form.get('from_player')
         to_player = request.form.get('to_player')
-        amount = int(request.form.get('amount'))
+        amount = request.form.get('amount', type=int)
         reason = request.form.get('reason')
         
-        if from_player == to_player:
-            flash('Non puoi trasferire denaro allo stesso giocatore!', 'error')
-            return redirect(url_for('transfer'))
-        
-        if players[from_player]['balance'] < amount:
-            flash('Saldo insufficiente!', 'error')
+        error = apply_transfer(g.game, from_player, to_player, amount, reason)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('transfer'))
         
-        players[from_player]['balance'] -= amount
-        players[to_player]['balance'] += amount
-        
-        transactions.append({
-            'timestamp': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-            'from_player': players[from_player]['name'],
-            'to_player': players[to_player]['name'],
-            'amount': amount,
-            'reason': reason
-        })
-        
+        mark_dirty(g.game_id)
         flash(f'Trasferimento di €{amount} completato!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template_string(TRANSFER_TEMPLATE, players=players)
 
-@app.route('/admin/report')
+@game_route('/admin/scheduled', methods=['GET', 'POST'])
+def scheduled_transfers():
+    if session_key('admin') not in session:
+        return redirect(url_for('admin_login'))
+    
+    players = g.game['players']
+    if request.method == 'POST':
+        from_player = request.form.get('from_player')
+        to_players = request.form.getlist('to_players')
+        amount = request.form.get('amount', type=int)
+        reason = request.form.get('reason')
+        delay = request.form.get('delay', type=int)
+        interval = request.form.get('interval', type=int)
+        
+        if amount is None or amount <= 0:
+            flash('Importo non valido!', 'error')
+            return redirect(url_for('scheduled_transfers'))
+        
+        if delay is None or delay < 0 or interval is None or interval < 0:
+            flash('Tempi non validi!', 'error')
+            return redirect(url_for('scheduled_transfers'))
+        
+        if not to_players:
+            flash('Seleziona almeno un destinatario!', 'error')
+            return redirect(url_for('scheduled_transfers'))
+        
+        if from_player in to_players:
+            flash('Non puoi trasferire denaro allo stesso giocatore!', 'error')
+            return redirect(url_for('scheduled_transfers'))
+        
+        schedule_transfer(g.game_id, g.game, from_player, to_players, amount, reason,
+                          run_at=scheduler.clock() + delay * 60, interval=interval * 60 or None)
+        mark_dirty(g.game_id)
+        flash('Trasferimento programmato!', 'success')
+        return redirect(url_for('scheduled_transfers'))
+    
+    jobs = sorted(g.game['scheduled_jobs'].values(), key=lambda job: job['next_run'])
+    return render_template_string(SCHEDULED_TEMPLATE, players=players, jobs=jobs)
+
+@game_route('/admin/scheduled/<job_id>/cancel', methods=['POST'])
+def cancel_scheduled_transfer(job_id):
+    if session_key('admin') not in session:
+        return redirect(url_for('admin_login'))
+    
+    if g.game['scheduled_jobs'].pop(job_id, None):
+        mark_dirty(g.game_id)
+        flash('Trasferimento programmato annullato.', 'success')
+    
+    return redirect(url_for('scheduled_transfers'))
+
+@game_route('/admin/transactions/search')
+def search_transactions():
+    if session_key('admin') not in session:
+        return redirect(url_for('admin_login'))
+    
+    players = g.game['players']
+    args = {k: v for k, v in request.args.items() if v and k in SEARCH_FILTERS}
+    page = max(request.args.get('page', 1, type=int), 1)
+    
+    min_amount = request.args.get('min_amount', type=int)
+    max_amount = request.args.get('max_amount', type=int)
+    ts_from = parse_datetime_local(args['date_from']) if 'date_from' in args else None
+    ts_to = parse_datetime_local(args['date_to']) if 'date_to' in args else None
+    
+    invalid = [('min_amount', min_amount), ('max_amount', max_amount), ('date_from', ts_from), ('date_to', ts_to)]
+    if any(name in args and value is None for name, value in invalid):
+        flash('Filtri non validi!', 'error')
+        results, has_next = [], False
+    elif 'player' in args and args['player'] not in players:
+        results, has_next = [], False
+    else:
+        results, has_next = query_transactions(
+            g.game,
+            query=args.get('q', ''),
+            player_name=players[args['player']]['name'] if 'player' in args else None,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            ts_from=ts_from,
+            # Il minuto finale è incluso per intero
+            ts_to=ts_to + 59 if ts_to is not None else None,
+            page=page)
+    
+    return render_template_string(SEARCH_TEMPLATE,
+                                 players=players,
+                                 args=args,
+                                 page=page,
+                                 results=results,
+                                 has_next=has_next)
+
+@game_route('/admin/report')
 def final_report():
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
     return render_template_string(REPORT_TEMPLATE, 
-                                 players=players, 
-                                 initial_balance=settings['initial_balance'])
+                                 players=g.game['players'], 
+                                 initial_balance=g.game['settings']['initial_balance'])
 
-@app.route('/admin/settings', methods=['GET', 'POST'])
+@game_route('/admin/settings', methods=['GET', 'POST'])
 def settings_page():
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
+    settings = g.game['settings']
     if request.method == 'POST':
         settings['initial_balance'] = int(request.form.get('initial_balance'))
+        if request.form.get('admin_password'):
+            settings['admin_password'] = request.form.get('admin_password')
+        mark_dirty(g.game_id)
         flash('Impostazioni salvate!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template_string(SETTINGS_TEMPLATE, settings=settings)
 
-@app.route('/admin/reset', methods=['POST'])
+@game_route('/admin/reset', methods=['POST'])
 def reset_all():
-    if 'admin' not in session:
+    if session_key('admin') not in session:
         return redirect(url_for('admin_login'))
     
-    players.clear()
-    pending_registrations.clear()
-    transactions.clear()
+    g.game['players'].clear()
+    g.game['pending_registrations'].clear()
+    g.game['transactions'].clear()
+    g.game['search_index'] = new_search_index()
+    g.game['balance_history'].clear()
+    g.game['scheduled_jobs'].clear()
+    mark_dirty(g.game_id)
     flash('Tutti i dati sono stati cancellati!', 'success')
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/logout')
+@game_route('/api/balance-history')
+def balance_history_api():
+    if session_key('admin') not in session and session_key('player_id') not in session:
+        return jsonify({'error': 'Non autorizzato'}), 401
+    
+    players = g.game['players']
+    balance_history = g.game['balance_history']
+    player_id = request.args.get('player')
+    if session_key('admin') not in session:
+        # I giocatori vedono solo il proprio storico
+        player_id = session[session_key('player_id')]
+    points = request.args.get('points', HISTORY_DEFAULT_POINTS, type=int)
+    points = min(max(points, 3), HISTORY_MAX_POINTS)
+    mode = request.args.get('mode', 'lttb')
+    downsamplers = {'lttb': downsample_lttb, 'minmax': downsample_minmax}
+    if mode not in downsamplers:
+        return jsonify({'error': 'Modalità non valida'}), 400
+    downsample = downsamplers[mode]
+    
+    selected = [player_id] if player_id else list(players)
+    series = {pid: balance_history.get(pid, []) for pid in selected if pid in players}
+    starts = [buckets[0][0] for buckets in series.values() if buckets]
+    t0 = min(starts) if starts else 0
+    
+    # Tempi espressi in minuti relativi a t0 per tenere il JSON compatto
+    result = {}
+    for pid, buckets in series.items():
+        sampled = downsample(buckets, points)
+        for p in sampled:
+            p[0] = (p[0] - t0) // HISTORY_BUCKET_SECONDS
+        result[pid] = {'name': players[pid]['name'], 'points': sampled}
+    
+    return jsonify({'t0': t0, 'step': HISTORY_BUCKET_SECONDS, 'mode': mode, 'series': result})
+
+@game_route('/logout')
 def logout():
-    session.clear()
+    session.pop(session_key('admin'), None)
+    session.pop(session_key('player_id'), None)
     flash('Disconnesso con successo!', 'success')
     return redirect(url_for('index'))
 
+def create_app():
+    """Punto di ingresso per gunicorn (vedi render.yaml): avvia i trasferimenti programmati.
+    
+    Lo stato delle stanze vive nella memoria del processo, quindi va usato un solo
+    worker: con più worker ogni job verrebbe eseguito più volte.
+    """
+    scheduler.start()
+    return app
+
 if __name__ == '__main__':
+    scheduler.start()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,45 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bank
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(1000)
+
+
+@pytest.fixture
+def scheduler(monkeypatch, clock):
+    scheduler = bank.TransferScheduler(clock=clock)
+    monkeypatch.setattr(bank, 'scheduler', scheduler)
+    return scheduler
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    """Stanza default vuota con tre giocatori da 100, isolata su una cartella temporanea."""
+    monkeypatch.setattr(bank, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(bank, 'games', OrderedDict())
+    monkeypatch.setattr(bank, 'dirty_games', set())
+    monkeypatch.setattr(bank, 'game_refs', {})
+    game = bank.get_game(bank.DEFAULT_GAME_ID)
+    for player_id, name in [('player_1', 'Anna'), ('player_2', 'Bruno'), ('player_3', 'Carla')]:
+        game['players'][player_id] = {'name': name, 'password': 'x', 'balance': 100}
+    return game
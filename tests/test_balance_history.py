@@ -0,0 +1,93 @@
+import pytest
+
+import app as bank
+
+
+def test_record_balance_merges_updates_within_a_minute(game):
+    bank.record_balance(game, 'player_1', 100, now=120)
+    bank.record_balance(game, 'player_1', 40, now=150)
+    bank.record_balance(game, 'player_1', 160, now=170)
+    bank.record_balance(game, 'player_1', 90, now=179)
+    bank.record_balance(game, 'player_1', 80, now=180)
+
+    assert game['balance_history']['player_1'] == [[120, 40, 160, 90], [180, 80, 80, 80]]
+
+
+def test_lttb_keeps_endpoints_and_returns_requested_points():
+    buckets = [[i * 60, v, v, v] for i, v in enumerate([0, 5, 1, 9, 2, 2, 8, 0, 3, 7])]
+
+    sampled = bank.downsample_lttb(buckets, 4)
+
+    assert len(sampled) == 4
+    assert sampled[0] == [0, 0]
+    assert sampled[-1] == [540, 7]
+    assert bank.downsample_lttb(buckets, 2) == [[0, 0], [540, 7]]
+    assert len(bank.downsample_lttb(buckets, 20)) == 10
+
+
+def test_minmax_groups_keep_extremes_and_last_value():
+    buckets = [[i * 60, v - 1, v + 1, v] for i, v in enumerate([10, 20, 30, 40, 50])]
+
+    assert bank.downsample_minmax(buckets, 2) == [[0, 9, 31, 30], [180, 39, 51, 50]]
+    assert bank.downsample_minmax(buckets, 10) == buckets
+
+
+@pytest.fixture
+def history(game):
+    for player_id in game['players']:
+        for i in range(1000):
+            bank.record_balance(game, player_id, i % 37, now=i * 60)
+    return game
+
+
+def login_admin(client):
+    client.post('/admin/login', data={'password': bank.DEFAULT_ADMIN_PASSWORD})
+    return client
+
+
+def points(response, player_id='player_1'):
+    return response.get_json()['series'][player_id]['points']
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', bank.HISTORY_DEFAULT_POINTS),
+    ('points=2', 3),
+    ('points=100000', bank.HISTORY_MAX_POINTS),
+    ('points=abc', bank.HISTORY_DEFAULT_POINTS),
+    ('points=1.5', bank.HISTORY_DEFAULT_POINTS),
+])
+def test_points_are_clamped(history, query, expected):
+    client = login_admin(bank.app.test_client())
+
+    response = client.get('/api/balance-history?' + query)
+
+    assert response.status_code == 200
+    assert len(points(response)) == expected
+
+
+def test_compact_offsets_are_relative_to_t0(history):
+    client = login_admin(bank.app.test_client())
+
+    data = client.get('/api/balance-history?player=player_1&mode=minmax&points=10').get_json()
+
+    assert data['t0'] == 0
+    assert data['mode'] == 'minmax'
+    assert [p[0] for p in data['series']['player_1']['points']] == list(range(0, 1000, 100))
+
+
+def test_unknown_mode_is_rejected(history):
+    client = login_admin(bank.app.test_client())
+
+    assert client.get('/api/balance-history?mode=spline').status_code == 400
+
+
+def test_player_sees_only_own_series(history):
+    client = bank.app.test_client()
+    client.post('/player/login', data={'player_id': 'player_2', 'password': 'x'})
+
+    assert list(client.get('/api/balance-history').get_json()['series']) == ['player_2']
+    assert list(client.get('/api/balance-history?player=player_1').get_json()['series']) == ['player_2']
+
+
+def test_anonymous_request_is_unauthorized(history):
+    assert bank.app.test_client().get('/api/balance-history').status_code == 401
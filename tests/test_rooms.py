@@ -0,0 +1,145 @@
+import json
+import os
+
+import pytest
+
+import app as bank
+
+
+def room_file(game_id):
+    return os.path.join(bank.DATA_DIR, f'{game_id}.json')
+
+
+def read_room(game_id):
+    with open(room_file(game_id), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_unknown_room_is_not_found_and_not_created(game):
+    client = bank.app.test_client()
+
+    assert client.get('/g/nessuna/').status_code == 404
+    assert client.post('/g/nessuna/admin/login', data={'password': 'admin123'}).status_code == 404
+    assert client.get('/g/../etc/').status_code == 404
+    assert 'nessuna' not in bank.games
+    assert not os.path.exists(room_file('nessuna'))
+
+
+@pytest.mark.parametrize('form, error', [
+    ({'game_id': 'con spazi', 'admin_password': 'segreto'}, 'Nome della stanza non valido!'),
+    ({'game_id': 'x' * 41, 'admin_password': 'segreto'}, 'Nome della stanza non valido!'),
+    ({'game_id': 'festa', 'admin_password': 'abc'}, 'La password deve avere almeno 4 caratteri!'),
+    ({'game_id': 'default', 'admin_password': 'segreto'}, 'Esiste già una stanza con questo nome!'),
+])
+def test_create_room_validation(game, form, error):
+    response = bank.app.test_client().post('/rooms/new', data=form, follow_redirects=True)
+
+    assert error in response.get_data(as_text=True)
+    assert not os.path.exists(room_file(form['game_id']))
+
+
+def test_create_room_saves_it_and_logs_in_the_creator(game):
+    client = bank.app.test_client()
+
+    response = client.post('/rooms/new', data={'game_id': 'festa', 'admin_password': 'segreto'})
+
+    assert response.location == '/g/festa/admin/dashboard'
+    assert read_room('festa')['settings']['admin_password'] == 'segreto'
+    assert client.get('/g/festa/admin/dashboard').status_code == 200
+
+    other = bank.app.test_client()
+    response = other.post('/rooms/new', data={'game_id': 'festa', 'admin_password': 'altro1'},
+                          follow_redirects=True)
+    assert 'Esiste già una stanza con questo nome!' in response.get_data(as_text=True)
+    assert read_room('festa')['settings']['admin_password'] == 'segreto'
+
+
+def test_admin_sessions_are_per_room(game):
+    bank.create_game('festa', 'segreto')
+    client = bank.app.test_client()
+
+    assert client.post('/g/festa/admin/login', data={'password': 'admin123'}).status_code == 200
+    assert client.get('/g/festa/admin/dashboard').location == '/g/festa/admin/login'
+
+    client.post('/g/festa/admin/login', data={'password': 'segreto'})
+    assert client.get('/g/festa/admin/dashboard').status_code == 200
+    assert client.get('/admin/dashboard').location == '/admin/login'
+
+    client.get('/g/festa/logout')
+    assert client.get('/g/festa/admin/dashboard').location == '/g/festa/admin/login'
+
+
+def test_session_keys_are_isolated():
+    assert bank.session_key('admin', bank.DEFAULT_GAME_ID) == 'admin'
+    assert bank.session_key('admin', 'festa') == 'festa:admin'
+    assert bank.session_key('player_id', 'festa') != bank.session_key('player_id', 'natale')
+
+
+def test_lru_eviction_writes_only_dirty_rooms(game, monkeypatch):
+    monkeypatch.setattr(bank, 'MAX_GAMES_IN_MEMORY', 2)
+    for game_id in ('a', 'b'):
+        bank.create_game(game_id, 'segreto')
+    bank.games['a']['settings']['initial_balance'] = 7
+    bank.mark_dirty('a')
+    bank.games['b']['settings']['initial_balance'] = 9
+
+    bank.get_game('default')
+
+    assert list(bank.games) == ['b', 'default']
+    assert read_room('a')['settings']['initial_balance'] == 7
+
+    bank.create_game('c', 'segreto')
+
+    assert list(bank.games) == ['default', 'c']
+    assert read_room('b')['settings']['initial_balance'] == 100
+    assert not os.path.exists(room_file(bank.DEFAULT_GAME_ID))
+
+
+def test_idle_rooms_are_evicted(game, monkeypatch):
+    bank.create_game('festa', 'segreto')
+    bank.games['festa']['last_access'] -= bank.GAME_IDLE_SECONDS + 1
+
+    bank.get_game('default')
+
+    assert 'festa' not in bank.games
+    assert bank.get_game('festa') is not None
+
+
+def test_rooms_in_use_are_not_evicted(game, monkeypatch):
+    monkeypatch.setattr(bank, 'MAX_GAMES_IN_MEMORY', 1)
+    festa = bank.create_game('festa', 'segreto')
+    bank.pin_game('festa')
+
+    bank.get_game('default')
+    festa['settings']['initial_balance'] = 42
+    bank.mark_dirty('festa')
+
+    assert bank.games['festa'] is festa
+    bank.unpin_game('festa')
+    bank.get_game('default')
+    assert 'festa' not in bank.games
+    assert read_room('festa')['settings']['initial_balance'] == 42
+
+
+def test_requests_release_their_room(game):
+    client = bank.app.test_client()
+
+    client.get('/')
+    client.get('/g/nessuna/')
+
+    assert bank.game_refs == {}
+
+
+def test_save_and_load_round_trip(game, scheduler):
+    bank.apply_transfer(game, 'player_1', 'player_2', 10, 'Vinto alla tombola')
+    bank.schedule_transfer(bank.DEFAULT_GAME_ID, game, 'player_1', ['player_3'], 5, 'Stipendio', 2000, 60)
+
+    bank.save_game(bank.DEFAULT_GAME_ID, game)
+    loaded = bank.load_game(bank.DEFAULT_GAME_ID)
+
+    for key in ('players', 'pending_registrations', 'transactions', 'settings', 'balance_history', 'scheduled_jobs'):
+        assert loaded[key] == game[key]
+    assert 'search_index' not in read_room(bank.DEFAULT_GAME_ID)
+
+    bank.games.clear()
+    assert bank.get_game(bank.DEFAULT_GAME_ID)['search_index'] == game['search_index']
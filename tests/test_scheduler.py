@@ -0,0 +1,119 @@
+import app as bank
+
+
+def schedule(game, from_player, to_players, amount, run_at, interval=None):
+    return bank.schedule_transfer(bank.DEFAULT_GAME_ID, game, from_player, to_players,
+                                  amount, 'Stipendio', run_at, interval)
+
+
+def balances(game):
+    return {player_id: p['balance'] for player_id, p in game['players'].items()}
+
+
+def test_one_off_job_runs_once_when_due(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 10, run_at=1060)
+
+    assert scheduler.run_pending() == 0
+    clock.advance(60)
+    assert scheduler.run_pending() == 1
+    assert balances(game) == {'player_1': 90, 'player_2': 110, 'player_3': 100}
+    assert job_id not in game['scheduled_jobs']
+
+    clock.advance(3600)
+    assert scheduler.run_pending() == 0
+    assert len(game['transactions']) == 1
+
+
+def test_recurring_job_runs_every_interval(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 5, run_at=1100, interval=100)
+
+    for _ in range(3):
+        clock.advance(100)
+        assert scheduler.run_pending() == 1
+
+    assert balances(game)['player_2'] == 115
+    assert game['scheduled_jobs'][job_id]['next_run'] == 1400
+
+
+def test_one_to_many_payout(game, scheduler, clock):
+    schedule(game, 'player_1', ['player_2', 'player_3'], 20, run_at=1000)
+
+    assert scheduler.run_pending() == 1
+    assert balances(game) == {'player_1': 60, 'player_2': 120, 'player_3': 120}
+    assert [t['to_player'] for t in game['transactions']] == ['Bruno', 'Carla']
+
+
+def test_cancelled_job_is_skipped(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 10, run_at=1000)
+    del game['scheduled_jobs'][job_id]
+
+    assert scheduler.run_pending() == 0
+    assert balances(game)['player_1'] == 100
+    assert not scheduler.heap
+
+
+def test_due_jobs_are_run_in_batches(game, scheduler, clock):
+    scheduler.batch_size = 3
+    for i in range(5):
+        schedule(game, 'player_1', ['player_2'], 1, run_at=1000 + i)
+    clock.advance(10)
+
+    assert scheduler.run_pending() == 3
+    assert scheduler.run_pending() == 2
+    assert scheduler.run_pending() == 0
+    assert balances(game)['player_2'] == 105
+
+
+def test_missed_recurrences_are_coalesced(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 5, run_at=1060, interval=60)
+
+    # Server fermo per 10 minuti: una sola esecuzione, poi si riparte dal prossimo slot futuro
+    clock.advance(600)
+    assert scheduler.run_pending() == 1
+    assert balances(game)['player_2'] == 105
+    assert game['scheduled_jobs'][job_id]['next_run'] == 1660
+    assert scheduler.run_pending() == 0
+
+
+def test_failed_transfer_is_reported_on_job(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 500, run_at=1000, interval=60)
+
+    assert scheduler.run_pending() == 1
+    assert balances(game)['player_1'] == 100
+    assert 'Saldo insufficiente!' in game['scheduled_jobs'][job_id]['last_error']
+
+
+def test_failed_one_off_job_is_kept_and_reported(game, scheduler, clock, caplog):
+    job_id = schedule(game, 'player_1', ['player_2'], 500, run_at=1000)
+
+    assert scheduler.run_pending() == 1
+
+    job = game['scheduled_jobs'][job_id]
+    assert job['failed']
+    assert 'Saldo insufficiente!' in job['last_error']
+    assert game['transactions'] == []
+    assert job_id in caplog.text
+
+    # Un job fallito non viene rieseguito, né ora né alla ripresa dal disco
+    assert scheduler.run_pending(clock() + 3600) == 0
+    bank.save_game(bank.DEFAULT_GAME_ID, game)
+    scheduler.resume_from_disk()
+    assert not scheduler.heap
+
+
+def test_failed_one_off_job_is_listed_and_can_be_cancelled(game, scheduler, clock):
+    job_id = schedule(game, 'player_1', ['player_2'], 500, run_at=1000)
+    scheduler.run_pending()
+    client = bank.app.test_client()
+    client.post('/admin/login', data={'password': bank.DEFAULT_ADMIN_PASSWORD})
+
+    assert 'Non eseguito' in client.get('/admin/scheduled').get_data(as_text=True)
+
+    client.post(f'/admin/scheduled/{job_id}/cancel')
+    assert game['scheduled_jobs'] == {}
+
+
+def test_apply_transfer_rejects_non_positive_amounts(game):
+    assert bank.apply_transfer(game, 'player_1', 'player_2', -10, 'x') == 'Importo non valido!'
+    assert bank.apply_transfer(game, 'player_1', 'player_2', 0, 'x') == 'Importo non valido!'
+    assert balances(game)['player_1'] == 100
@@ -0,0 +1,191 @@
+import random
+import time
+
+import pytest
+
+import app as bank
+
+
+def transaction(reason, from_player='Anna', to_player='Bruno', amount=10, ts=0):
+    return {'timestamp': '', 'ts': ts, 'from_player': from_player, 'to_player': to_player,
+            'amount': amount, 'reason': reason}
+
+
+def search_game(transactions):
+    return {'transactions': transactions, 'search_index': bank.build_search_index(transactions)}
+
+
+def reasons(results):
+    return [t['reason'] for t in results]
+
+
+def test_tokenize_folds_case_accents_and_punctuation():
+    assert bank.tokenize('Vinto alla TOMBOLA!') == ['vinto', 'alla', 'tombola']
+    assert bank.tokenize('Città, perché?') == ['citta', 'perche']
+    assert bank.tokenize(None) == []
+
+
+def test_build_matches_incremental_indexing():
+    rng = random.Random(0)
+    transactions = [
+        transaction(rng.choice(['Stipendio', 'Vinto alla tombola', 'Città bonus', 'Penalità']),
+                    from_player=rng.choice('ABC'), to_player=rng.choice('ABC'),
+                    amount=rng.randint(1, 20), ts=i)
+        for i in range(500)
+    ]
+
+    index = bank.new_search_index()
+    for i, t in enumerate(transactions):
+        bank.index_transaction(index, i, t)
+
+    assert index == bank.build_search_index(transactions)
+
+
+def test_apply_transfer_keeps_index_in_sync(game):
+    bank.apply_transfer(game, 'player_1', 'player_2', 10, 'Vinto alla tombola')
+    bank.apply_transfer(game, 'player_2', 'player_3', 5, 'Stipendio')
+    bank.apply_transfer(game, 'player_3', 'player_1', 10, 'Tombola di Natale')
+
+    assert game['search_index'] == bank.build_search_index(game['transactions'])
+
+
+def test_query_requires_all_tokens_and_folds_accents():
+    game = search_game([
+        transaction('Vinto alla tombola'),
+        transaction('Tombola di Natale'),
+        transaction('Città bonus'),
+    ])
+
+    assert reasons(bank.query_transactions(game, 'tombola')[0]) == ['Tombola di Natale', 'Vinto alla tombola']
+    assert reasons(bank.query_transactions(game, 'tombola natale')[0]) == ['Tombola di Natale']
+    assert reasons(bank.query_transactions(game, 'CITTA')[0]) == ['Città bonus']
+    assert bank.query_transactions(game, 'tombola bonus') == ([], False)
+
+
+def test_query_filters_by_player_amount_and_time():
+    game = search_game([
+        transaction('a', from_player='Anna', to_player='Bruno', amount=5, ts=100),
+        transaction('b', from_player='Bruno', to_player='Carla', amount=50, ts=200),
+        transaction('c', from_player='Carla', to_player='Anna', amount=500, ts=300),
+    ])
+
+    assert reasons(bank.query_transactions(game, player_name='Anna')[0]) == ['c', 'a']
+    assert reasons(bank.query_transactions(game, min_amount=10, max_amount=100)[0]) == ['b']
+    assert reasons(bank.query_transactions(game, max_amount=50, player_name='Carla')[0]) == ['b']
+    assert reasons(bank.query_transactions(game, ts_from=150, ts_to=300)[0]) == ['c', 'b']
+    assert bank.query_transactions(game, player_name='Nessuno') == ([], False)
+    assert bank.query_transactions(game, min_amount=100, max_amount=10) == ([], False)
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'query': 'stipendio'},
+    {'query': 'stipendio', 'player_name': 'Anna'},
+    {'min_amount': 10, 'max_amount': 10},
+    {'query': 'stipendio', 'min_amount': 1},
+])
+def test_pagination_reports_next_page(filters):
+    game = search_game([transaction('Stipendio', amount=10, ts=i) for i in range(120)])
+
+    pages = [bank.query_transactions(game, page=page, page_size=50, **filters) for page in (1, 2, 3, 4)]
+
+    assert [len(results) for results, _ in pages] == [50, 50, 20, 0]
+    assert [has_next for _, has_next in pages] == [True, True, False, False]
+    assert [t['ts'] for t in pages[0][0]] == list(range(119, 69, -1))
+    assert [t['ts'] for t in pages[2][0]] == list(range(19, -1, -1))
+
+
+@pytest.fixture
+def admin(game):
+    client = bank.app.test_client()
+    client.post('/admin/login', data={'password': bank.DEFAULT_ADMIN_PASSWORD})
+    bank.apply_transfer(game, 'player_1', 'player_2', 10, 'Vinto alla tombola')
+    return client
+
+
+@pytest.mark.parametrize('query', [
+    'min_amount=1.5',
+    'max_amount=abc',
+    'date_from=ieri',
+    'date_to=2026-13-01T00:00',
+])
+def test_search_page_rejects_invalid_filters(admin, query):
+    response = admin.get('/admin/transactions/search?' + query)
+    body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert 'Filtri non validi!' in body
+    assert '<td>Vinto alla tombola</td>' not in body
+
+
+def test_search_page_ignores_invalid_page_number(admin):
+    response = admin.get('/admin/transactions/search?page=x')
+
+    assert response.status_code == 200
+    assert '<td>Vinto alla tombola</td>' in response.get_data(as_text=True)
+
+
+def test_search_page_with_unknown_player_finds_nothing(admin):
+    found = admin.get('/admin/transactions/search?q=tombola').get_data(as_text=True)
+    missing = admin.get('/admin/transactions/search?q=tombola&player=player_99').get_data(as_text=True)
+
+    assert '<td>Vinto alla tombola</td>' in found
+    assert '<td>Vinto alla tombola</td>' not in missing
+
+
+def test_search_links_keep_only_known_filters(admin, game):
+    for _ in range(60):
+        bank.apply_transfer(game, 'player_2', 'player_1', 1, 'Vinto alla tombola')
+
+    body = admin.get('/admin/transactions/search?q=tombola&game_id=altra&_anchor=zz&_external=1').get_data(as_text=True)
+
+    assert 'href="/admin/transactions/search?q=tombola&amp;page=2"' in body
+    assert '/g/altra/' not in body
+    assert '#zz' not in body
+    assert 'http://' not in body
+
+
+@pytest.fixture(scope='module')
+def large_game():
+    """200.000 transazioni: lo "Stipendio" non arriva mai a P9 e non contiene mai "bonus"."""
+    rng = random.Random(3)
+    players = ['P%d' % i for i in range(10)]
+    choices = ['Stipendio', 'Vinto alla tombola', 'Bonus Natale', 'Penalità ritardo', 'Tombola bonus',
+               'Regalo', 'Scommessa', 'Multa', 'Premio', 'Cena']
+    transactions = []
+    for i in range(200000):
+        reason = rng.choice(choices)
+        to_players = players[:9] if reason == 'Stipendio' else players
+        transactions.append(transaction(reason, from_player=rng.choice(players[:9]),
+                                        to_player=rng.choice(to_players), amount=rng.randint(1, 100), ts=i))
+    return search_game(transactions)
+
+
+def brute_force(game, query='', player_name=None, min_amount=None, max_amount=None, page=1, page_size=50):
+    tokens = set(bank.tokenize(query))
+    matches = [t for t in reversed(game['transactions'])
+               if tokens <= set(bank.tokenize(t['reason']))
+               and (player_name is None or player_name in (t['from_player'], t['to_player']))
+               and (min_amount is None or t['amount'] >= min_amount)
+               and (max_amount is None or t['amount'] <= max_amount)]
+    start = (page - 1) * page_size
+    return matches[start:start + page_size], len(matches) > start + page_size
+
+
+@pytest.mark.parametrize('filters', [
+    {'query': 'tombola', 'player_name': 'P3', 'min_amount': 99, 'max_amount': 99},
+    {'query': 'stipendio', 'player_name': 'P9'},
+    {'query': 'stipendio bonus'},
+    {'query': 'vinto tombola', 'player_name': 'P2', 'page': 20},
+    {'min_amount': 10, 'page': 100},
+    {'min_amount': 50, 'max_amount': 50, 'page': 30},
+])
+def test_sparse_and_selective_queries_are_fast(large_game, filters):
+    bank.query_transactions(large_game, **filters)
+    started = time.perf_counter()
+    result = bank.query_transactions(large_game, **filters)
+    elapsed = time.perf_counter() - started
+
+    assert result == brute_force(large_game, **filters)
+    # Margine ampio per macchine lente: i tempi tipici sono di pochi millisecondi
+    assert elapsed < 0.1